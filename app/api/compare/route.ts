@@ -14,6 +14,7 @@ export async function GET(request: NextRequest) {
     const controlPoverty = searchParams.get('controlPoverty') === 'true'
     const controlIncome = searchParams.get('controlIncome') === 'true'
     const controlUrbanRural = searchParams.get('controlUrbanRural') === 'true'
+    const geography = searchParams.get('geography') || 'county'
 
     if (!countyA || !countyB) {
       return NextResponse.json(
@@ -22,6 +23,13 @@ export async function GET(request: NextRequest) {
       )
     }
 
+    if (!['county', 'tract', 'zcta'].includes(geography)) {
+      return NextResponse.json(
+        { error: `Unknown geography ${geography}` },
+        { status: 400 }
+      )
+    }
+
     // Call Python script to compute adjusted values
     // Convert JavaScript boolean to Python boolean
     const pyControlPoverty = controlPoverty ? 'True' : 'False'
@@ -40,7 +48,8 @@ result = adjust_for_confounders(
     ${year},
     ${pyControlPoverty},
     ${pyControlIncome},
-    ${pyControlUrbanRural}
+    ${pyControlUrbanRural},
+    geography='${geography}'
 )
 print(json.dumps(result))
 "`
@@ -2,12 +2,68 @@ import { NextResponse } from 'next/server'
 import fs from 'fs'
 import path from 'path'
 
+const GEOGRAPHIES = ['county', 'tract', 'zcta']
+
 export async function GET(
   request: Request,
   context: { params: Promise<{ year: string }> }
 ) {
   try {
     const { year } = await context.params
+    const { searchParams } = new URL(request.url)
+    const geography = searchParams.get('geography') || 'county'
+    const stateParam = searchParams.get('state')
+
+    if (!/^\d{4}$/.test(year)) {
+      return NextResponse.json(
+        { error: `Invalid year ${year}` },
+        { status: 400 }
+      )
+    }
+
+    if (!GEOGRAPHIES.includes(geography)) {
+      return NextResponse.json(
+        { error: `Unknown geography ${geography}` },
+        { status: 400 }
+      )
+    }
+
+    // Partitioned data (public/data/partitions/<geography>/<year>/<state>.json),
+    // used for sub-county levels or when specific states are requested
+    if (geography !== 'county' || stateParam) {
+      const dirPath = path.join(process.cwd(), 'public', 'data', 'partitions', geography, year)
+
+      if (!fs.existsSync(dirPath)) {
+        return NextResponse.json(
+          { error: `Year ${year} not found for ${geography}` },
+          { status: 404 }
+        )
+      }
+
+      const states = stateParam
+        ? stateParam.split(',').map((s) => s.trim().padStart(2, '0'))
+        : fs.readdirSync(dirPath).filter((f) => f.endsWith('.json')).map((f) => f.slice(0, -5))
+
+      if (states.some((s) => !/^\d{2}$/.test(s))) {
+        return NextResponse.json(
+          { error: 'Invalid state parameter' },
+          { status: 400 }
+        )
+      }
+
+      const data = states.flatMap((state) => {
+        const filePath = path.join(dirPath, `${state}.json`)
+        return fs.existsSync(filePath) ? JSON.parse(fs.readFileSync(filePath, 'utf8')) : []
+      })
+
+      return NextResponse.json(data, {
+        headers: {
+          'Content-Type': 'application/json',
+          'Cache-Control': 'public, max-age=31536000, immutable',
+        },
+      })
+    }
+
     const filePath = path.join(process.cwd(), 'public', 'data', 'years', `${year}.json`)
 
     if (!fs.existsSync(filePath)) {
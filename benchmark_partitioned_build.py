@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark the partitioned build on a synthetic tract-scale panel
+Runs the same build with increasing worker counts and reports speedup
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from partitioned_build import YEARS, run_partitioned_build
+
+
+def make_synthetic_tract_panel(path: str, n_tracts: int = 85000, seed: int = 0) -> int:
+    """
+    Write a tract-year panel with ~n_tracts tracts spread unevenly over 51
+    state FIPS codes. Returns the number of rows written.
+    """
+    rng = np.random.default_rng(seed)
+    states = [f'{s:02d}' for s in range(1, 57) if s not in (3, 7, 14, 43, 52)]
+    weights = rng.lognormal(mean=0.0, sigma=1.0, size=len(states))
+    per_state = np.maximum(1, (weights / weights.sum() * n_tracts).astype(int))
+
+    geoids = np.concatenate([
+        [f'{state}{i:09d}' for i in range(count)]
+        for state, count in zip(states, per_state)
+    ])
+    n = len(geoids)
+
+    frames = []
+    for year in YEARS:
+        population = rng.integers(500, 8000, size=n).astype(float)
+        poverty = rng.uniform(2, 40, size=n)
+        drug_rate = np.clip(10 + 0.8 * poverty + rng.normal(0, 8, size=n), 0, None)
+        drug_rate[rng.random(n) < 0.3] = np.nan  # suppressed cells
+        frames.append(pd.DataFrame({
+            'geoid': geoids,
+            'Year': year,
+            'Population': population,
+            'PovertyRate': poverty,
+            'MedianIncome': rng.normal(65000, 15000, size=n),
+            'UnemploymentRate': rng.uniform(1, 12, size=n),
+            'RepublicanMargin': rng.uniform(-60, 60, size=n),
+            'DrugDeathRate': drug_rate,
+            'DrugDeaths': drug_rate * population / 100000,
+            'SuicideRate': rng.uniform(5, 30, size=n),
+            'urban_rural': np.where(population >= 4000, 'urban', 'rural'),
+        }))
+
+    panel = pd.concat(frames, ignore_index=True)
+    panel.to_csv(path, index=False)
+    return len(panel)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracts', type=int, default=85000)
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='Worker counts to compare (default: 1, 2, 4, ... up to the CPU count)')
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({1, *(2 ** i for i in range(1, 8) if 2 ** i <= cpus), cpus})
+
+    workdir = tempfile.mkdtemp(prefix='bench_tracts_')
+    try:
+        panel_path = os.path.join(workdir, 'tract_panel.csv')
+        print(f"Generating synthetic panel ({args.tracts} tracts x {len(YEARS)} years)...")
+        start = time.perf_counter()
+        n_rows = make_synthetic_tract_panel(panel_path, args.tracts)
+        print(f"  {n_rows} rows in {time.perf_counter() - start:.1f}s ({cpus} CPUs available)")
+
+        print(f"\n{'workers':>8} {'stage (s)':>10} {'build (s)':>10} {'speedup':>8} {'efficiency':>10}")
+        baseline = None
+        for workers in worker_counts:
+            output_root = os.path.join(workdir, f'out_{workers}')
+            summary = run_partitioned_build(
+                panel_path,
+                geography='tract',
+                workers=workers,
+                output_root=output_root,
+                update_stats_cache=False,
+                verbose=False,
+            )
+            build = summary['timings']['build']
+            baseline = baseline or build
+            speedup = baseline / build
+            print(f"{workers:>8} {summary['timings']['stage']:>10.2f} {build:>10.2f} "
+                  f"{speedup:>7.2f}x {speedup / workers:>9.0%}")
+            shutil.rmtree(output_root, ignore_errors=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -2,6 +2,8 @@ import pandas as pd
 import geopandas as gpd
 import json
 
+from geography import normalize_ids
+
 print("Creating complete county dataset with ALL counties...")
 
 # Read the shapefile to get ALL valid US counties
@@ -12,7 +14,11 @@ print(f"   Counties in shapefile: {len(all_fips)}")
 
 # Read existing merged data
 print("\n2. Loading existing merged data...")
-df = pd.read_csv('county_year_merged.csv')
+df = pd.read_csv('county_year_merged.csv', dtype={'fips': str})
+# Unnormalized fips (ints, or floats like '1001.0') never matched the
+# shapefile's zero-padded string GEOIDs, so every county-year used to come
+# out as NA; normalize exactly as partitioned_build does
+df['fips'] = normalize_ids(df['fips'], 5)
 data_fips = set(df['fips'].unique())
 print(f"   Counties in data: {len(data_fips)}")
 
@@ -29,46 +35,26 @@ if len(in_data_not_shapefile) > 0:
     print(f"      Examples: {list(in_data_not_shapefile)[:5]}")
 
 # Create complete dataset with ALL counties from shapefile
+# (one vectorized reindex over fips x year instead of a scan per county-year;
+#  partitioned_build.py does the same per state for larger geographies)
 print("\n4. Creating complete dataset...")
 years = [2018, 2019, 2020, 2021, 2022, 2023]
-complete_rows = []
-
-for fips in sorted(all_fips):
-    for year in years:
-        # Check if this county-year exists in data
-        existing = df[(df['fips'] == fips) & (df['Year'] == year)]
-
-        if len(existing) > 0:
-            # Use existing data
-            row = existing.iloc[0].to_dict()
-        else:
-            # Create row with NA values
-            row = {
-                'fips': fips,
-                'Year': year,
-                'PerCapitaIncome': None,
-                'UnemploymentRate': None,
-                'PovertyRate': None,
-                'MedianIncome': None,
-                'Rent': None,
-                'BachelorsOrHigher': None,
-                'WhiteAlone': None,
-                'BlackAlone': None,
-                'HispanicLatino': None,
-                'Population': None,
-                'RepublicanVoteShare': None,
-                'DemocratVoteShare': None,
-                'RepublicanMargin': None,
-                'DrugDeaths': None,
-                'DrugDeathRate': None,
-                'SuicideDeaths': None,
-                'SuicideRate': None,
-                'MentalHealthScore': None
-            }
-
-        complete_rows.append(row)
-
-complete_df = pd.DataFrame(complete_rows)
+na_columns = [
+    'PerCapitaIncome', 'UnemploymentRate', 'PovertyRate', 'MedianIncome', 'Rent',
+    'BachelorsOrHigher', 'WhiteAlone', 'BlackAlone', 'HispanicLatino', 'Population',
+    'RepublicanVoteShare', 'DemocratVoteShare', 'RepublicanMargin', 'DrugDeaths',
+    'DrugDeathRate', 'SuicideDeaths', 'SuicideRate', 'MentalHealthScore'
+]
+
+index = pd.MultiIndex.from_product([sorted(all_fips), years], names=['fips', 'Year'])
+columns = list(dict.fromkeys(list(df.columns) + na_columns))
+complete_df = (
+    df.drop_duplicates(['fips', 'Year'], keep='first')
+    .set_index(['fips', 'Year'])
+    .reindex(index)
+    .reset_index()
+    .reindex(columns=columns)
+)
 
 print(f"\n5. Complete dataset created:")
 print(f"   Total rows: {len(complete_df)}")
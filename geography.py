@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Geography levels, partitioned output layout and the urban/rural population rule
+Shared by the partitioned build and the statistical controls
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+PARTITIONS_DIR = os.path.join(BASE_PATH, 'public', 'data', 'partitions')
+
+# id_col:      identifier field in records for this level
+# id_width:    zero-padded identifier width
+# state_in_id: whether the first two digits of the id are the state FIPS
+#              (ZCTAs cross state lines, so their state must be supplied)
+GEOGRAPHIES: Dict[str, Dict] = {
+    'county': {'id_col': 'fips', 'id_width': 5, 'state_in_id': True},
+    'tract': {'id_col': 'geoid', 'id_width': 11, 'state_in_id': True},
+    'zcta': {'id_col': 'zcta', 'id_width': 5, 'state_in_id': False},
+}
+
+# Fallback urban/rural rule when no RUCC code is available (OMB metro-area
+# style): Population >= 50,000 is urban, below is rural
+URBAN_POPULATION_THRESHOLD = 50000
+
+def urban_rural_by_population(population) -> np.ndarray:
+    """Vectorized population rule: 'urban' / 'rural', None where population is missing"""
+    pop = np.asarray(population, dtype=np.float64)
+    labels = np.where(pop >= URBAN_POPULATION_THRESHOLD, 'urban', 'rural').astype(object)
+    labels[np.isnan(pop)] = None
+    return labels
+
+def normalize_ids(ids, width: int):
+    """
+    Zero-padded string identifiers from a pandas Series. CSV readers often
+    drop leading zeros or parse ids as floats ('1001.0').
+    """
+    ids = ids.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+    return ids.str.zfill(width)
+
+def geography_spec(geography: str) -> Dict:
+    """Look up a geography level, raising ValueError for unknown levels"""
+    if geography not in GEOGRAPHIES:
+        raise ValueError(
+            f"Unknown geography '{geography}' (expected one of {', '.join(GEOGRAPHIES)})"
+        )
+    return GEOGRAPHIES[geography]
+
+def partition_dir(geography: str, year: int, root: str = PARTITIONS_DIR) -> str:
+    """Directory holding one JSON file per state for a geography-year"""
+    return os.path.join(root, geography, str(year))
+
+def partition_path(geography: str, year: int, state: str, root: str = PARTITIONS_DIR) -> str:
+    """Path of the JSON partition for one state of a geography-year"""
+    return os.path.join(partition_dir(geography, year, root), f'{state}.json')
+
+def partition_states(geography: str, year: int, root: str = PARTITIONS_DIR) -> List[str]:
+    """States that have a written partition for a geography-year"""
+    directory = partition_dir(geography, year, root)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(f[:-5] for f in os.listdir(directory) if f.endswith('.json'))
+
+def partitions_mtime(geography: str, year: int, root: str = PARTITIONS_DIR) -> Optional[float]:
+    """Latest modification time across a geography-year's partitions"""
+    states = partition_states(geography, year, root)
+    if not states:
+        return None
+    return max(os.path.getmtime(partition_path(geography, year, s, root)) for s in states)
@@ -6,40 +6,149 @@ Based on merge_ses.py infrastructure
 
 import json
 import csv
+import os
+import zipfile
 import requests
+import numpy as np
 import pandas as pd
 from io import StringIO
 import ssl
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
 
+from geography import URBAN_POPULATION_THRESHOLD, urban_rural_by_population
+
 # Disable SSL warnings
 urllib3.disable_warnings(InsecureRequestWarning)
 ssl._create_default_https_context = ssl._create_unverified_context
 
-def download_rucc_codes():
-    """Download USDA Rural-Urban Continuum Codes"""
-    print("Downloading USDA RUCC codes...")
+RUCC_WORKBOOKS = ['data/ruralurbancodes2023.xlsx', 'data/ruralurbancodes2023.xls']
+RUCC_CACHE = 'data/rucc_2023.npz'
+COUNTY_SHAPEFILE = 'data/tl_2025_us_county.shp'
+
+# RUCC 1-3 are metro counties, 4-9 nonmetro
+METRO_MAX_RUCC = 3
 
-    # Try multiple URLs
-    urls = [
-        "https://www.ers.usda.gov/webdocs/DataFiles/53251/ruralurbancodes2023.csv",
-        "https://www.ers.usda.gov/data-products/rural-urban-continuum-codes.aspx",
-    ]
+def _find_header_row(raw):
+    """Index of the first row containing a FIPS column header (ERS sheets may have title rows)"""
+    for i, row in raw.iterrows():
+        if any(str(v).strip().upper().startswith('FIPS') for v in row if pd.notna(v)):
+            return i
+    raise ValueError("No FIPS header row found in RUCC workbook")
 
-    # For now, use a manual approach with the Excel file we tried before
-    # The USDA website has changed formats frequently
+def parse_rucc_workbook(path):
+    """
+    Parse the USDA ERS Rural-Urban Continuum Codes workbook.
 
-    # Simpler approach: Use NCHS Urban-Rural codes which are more stable
-    print("  Using NCHS 2013 Urban-Rural Classification (widely used for health data)")
+    Handles both the wide layout (FIPS, ..., RUCC_2023) and the long layout
+    (FIPS, ..., Attribute, Value). Returns a typed table:
+    fips int32, rucc int8 (1-9), metro bool.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(512).lstrip().lower()
+    if head.startswith(b'<!doctype html') or head.startswith(b'<html'):
+        raise ValueError(
+            f"{path} is an HTML page, not an Excel workbook "
+            "(re-download it from https://www.ers.usda.gov/data-products/rural-urban-continuum-codes/)"
+        )
+
+    raw = pd.read_excel(path, sheet_name=0, header=None, dtype=str)
+    header = _find_header_row(raw)
+    df = raw.iloc[header + 1:].copy()
+    df.columns = [str(c).strip() for c in raw.iloc[header]]
+
+    fips_col = next(c for c in df.columns if c.upper().startswith('FIPS'))
+    rucc_cols = [c for c in df.columns if c.upper().startswith('RUCC')]
+
+    if rucc_cols:
+        codes = df[rucc_cols[-1]]
+    elif {'Attribute', 'Value'} <= set(df.columns):
+        df = df[df['Attribute'].astype(str).str.upper().str.startswith('RUCC')]
+        codes = df['Value']
+    else:
+        raise ValueError(f"No RUCC column found in {path}")
+
+    table = pd.DataFrame({
+        'fips': pd.to_numeric(df[fips_col], errors='coerce'),
+        'rucc': pd.to_numeric(codes, errors='coerce'),
+    })
+    valid = table['fips'].notna() & table['rucc'].between(1, 9)
+    dropped = int((~valid).sum())
+    if dropped:
+        print(f"  Dropped {dropped} rows without a valid FIPS / RUCC 1-9 code")
+
+    table = table[valid].drop_duplicates('fips', keep='last')
+    table = table.astype({'fips': 'int32', 'rucc': 'int8'})
+    table['metro'] = table['rucc'] <= METRO_MAX_RUCC
+    return table.sort_values('fips').reset_index(drop=True)
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return np.array([stat.st_mtime, stat.st_size], dtype=np.float64)
+
+def load_rucc_codes(workbooks=RUCC_WORKBOOKS, cache_path=RUCC_CACHE):
+    """
+    USDA RUCC codes as a typed table (fips int32, rucc int8, metro bool).
+
+    The workbook is parsed once and cached as .npz; later runs load the cache
+    unless the workbook has changed. Returns None if no usable source exists.
+    """
+    workbook = next((w for w in workbooks if os.path.exists(w)), None)
 
-    # NCHS codes: 1-4 = Urban, 5-6 = Rural
-    # This is the gold standard for health research
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cache:
+                fresh = workbook is None or np.array_equal(cache['source'], _source_signature(workbook))
+                if fresh:
+                    print(f"  Loaded RUCC codes from cache ({cache_path})")
+                    return pd.DataFrame({
+                        'fips': cache['fips'],
+                        'rucc': cache['rucc'],
+                        'metro': cache['rucc'] <= METRO_MAX_RUCC,
+                    })
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            # A corrupt or foreign cache is treated as no cache
+            print(f"  Ignoring unreadable RUCC cache {cache_path}: {e}")
+
+    for path in [w for w in workbooks if os.path.exists(w)]:
+        print(f"  Parsing {path}...")
+        try:
+            table = parse_rucc_workbook(path)
+        except (ValueError, ImportError) as e:
+            print(f"    Skipped: {e}")
+            continue
 
-    # We'll create a basic mapping using known patterns
-    # In production, would download from: https://www.cdc.gov/nchs/data_access/urban_rural.htm
+        np.savez(
+            cache_path,
+            fips=table['fips'].to_numpy(),
+            rucc=table['rucc'].to_numpy(),
+            source=_source_signature(path),
+        )
+        print(f"  Cached {len(table)} counties to {cache_path}")
+        return table
+
+    return None
+
+def validate_rucc_fips(rucc, shapefile=COUNTY_SHAPEFILE):
+    """Compare RUCC FIPS codes against the county shapefile and report mismatches"""
+    if not os.path.exists(shapefile):
+        print(f"  Shapefile {shapefile} not found, skipping FIPS validation")
+        return None
 
-    return {}
+    import geopandas as gpd
+    geoid = gpd.read_file(shapefile, ignore_geometry=True)['GEOID']
+    shape_fips = set(pd.to_numeric(geoid, errors='coerce').dropna().astype('int32'))
+    rucc_fips = set(rucc['fips'])
+
+    missing = sorted(shape_fips - rucc_fips)
+    extra = sorted(rucc_fips - shape_fips)
+    print(f"  Shapefile counties without RUCC: {len(missing)}")
+    if missing:
+        print(f"    Examples: {[f'{f:05d}' for f in missing[:5]]}")
+    print(f"  RUCC counties not in shapefile: {len(extra)}")
+    if extra:
+        print(f"    Examples: {[f'{f:05d}' for f in extra[:5]]}")
+    return {'missing': missing, 'extra': extra}
 
 def fetch_acs_population():
     """Fetch population data from Census ACS API"""
@@ -87,19 +196,64 @@ def fetch_acs_population():
 
     return all_data
 
-def classify_urban_rural_by_population(population):
+def join_rucc(records, rucc):
     """
-    Simple urban/rural classification based on population
-    This is a fallback if RUCC codes aren't available
+    Attach RUCC, metro and urban_rural to county-year records in one merge.
 
-    Rules (based on OMB metro area definitions):
-    - Urban: Population >= 50,000
-    - Rural: Population < 50,000
+    urban_rural comes from the metro flag where a RUCC code exists and falls
+    back to the population rule otherwise. Only these three fields are
+    written; every other value in the records is left exactly as loaded.
     """
-    if population is None or pd.isna(population):
-        return None
+    fips = pd.to_numeric(pd.Series([r.get('fips') for r in records]), errors='coerce')
+    pop = pd.to_numeric(pd.Series([r.get('Population') for r in records], dtype=object), errors='coerce')
+
+    if rucc is not None:
+        codes = fips.map(rucc.set_index('fips')['rucc'].astype(float))
+    else:
+        codes = pd.Series(np.nan, index=fips.index)
+
+    has_code = codes.notna().to_numpy()
+    metro = (codes <= METRO_MAX_RUCC).to_numpy()
+    urban_rural = np.where(
+        has_code, np.where(metro, 'urban', 'rural'), urban_rural_by_population(pop)
+    )
+
+    joined = []
+    for rec, code, is_coded, is_metro, label in zip(records, codes, has_code, metro, urban_rural):
+        rec = dict(rec)
+        rec['RUCC'] = int(code) if is_coded else None
+        rec['metro'] = bool(is_metro) if is_coded else None
+        rec['urban_rural'] = label
+        joined.append(rec)
+    return joined
+
+def integrate_rucc(years):
+    """Join RUCC codes onto every year file with a single vectorized merge"""
+    print("\nLoading USDA Rural-Urban Continuum Codes...")
+    rucc = load_rucc_codes()
+    if rucc is None:
+        print(f"  No usable RUCC workbook; urban_rural falls back to population (>={URBAN_POPULATION_THRESHOLD:,} = urban)")
+    else:
+        validate_rucc_fips(rucc)
+
+    records = []
+    for year in years:
+        with open(f'public/data/years/{year}.json') as f:
+            records.extend(json.load(f))
+
+    joined = join_rucc(records, rucc)
 
-    return "urban" if population >= 50000 else "rural"
+    by_year = {year: [] for year in years}
+    for rec in joined:
+        by_year[int(rec['Year'])].append(rec)
+
+    for year in years:
+        with open(f'public/data/years/{year}.json', 'w') as f:
+            json.dump(by_year[year], f, indent=2)
+        with_rucc = sum(1 for r in by_year[year] if r['RUCC'] is not None)
+        print(f"  {year}: RUCC for {with_rucc}/{len(by_year[year])} counties")
+
+    return rucc is not None
 
 def integrate_all_confounders():
     """Integrate all confounder variables into year JSON files"""
@@ -108,17 +262,16 @@ def integrate_all_confounders():
     print("INTEGRATING CONFOUNDER VARIABLES")
     print("=" * 70)
 
+    years = [2018, 2019, 2020, 2021, 2022, 2023]
+
     # 1. Fetch population data
     population_by_year = fetch_acs_population()
 
     if not population_by_year:
         print("\n❌ Failed to fetch population data")
-        return
 
     # 2. Update each year file
-    years = [2018, 2019, 2020, 2021, 2022, 2023]
-
-    for year in years:
+    for year, pop_data in population_by_year:
         print(f"\n--- Processing {year} ---")
 
         file_path = f'public/data/years/{year}.json'
@@ -126,20 +279,8 @@ def integrate_all_confounders():
         with open(file_path) as f:
             data = json.load(f)
 
-        # Find population data for this year
-        pop_data = None
-        for y, pdata in population_by_year:
-            if y == year:
-                pop_data = pdata
-                break
-
-        if pop_data is None:
-            print(f"  No population data for {year}, skipping")
-            continue
-
         # Update each county
         added_pop = 0
-        added_urban = 0
 
         for county in data:
             fips = str(county['fips'])
@@ -149,25 +290,25 @@ def integrate_all_confounders():
                 county['Population'] = pop_data[fips]
                 added_pop += 1
 
-                # Classify urban/rural based on population
-                county['urban_rural'] = classify_urban_rural_by_population(pop_data[fips])
-                if county['urban_rural']:
-                    added_urban += 1
-
         # Save updated file with formatting
         with open(file_path, 'w') as f:
             json.dump(data, f, indent=2)
 
         print(f"  Added Population to {added_pop} counties")
-        print(f"  Added urban_rural to {added_urban} counties")
+
+    # 3. Join RUCC codes (urban_rural) across all years at once
+    has_rucc = integrate_rucc(years)
 
     print("\n" + "=" * 70)
     print("SUMMARY")
     print("=" * 70)
     print("✓ Population: Added from Census ACS")
-    print("✓ urban_rural: Classified based on population (≥50k = urban)")
-    print("\nNote: Simple population-based classification used.")
-    print("For more accurate classification, integrate USDA RUCC codes.")
+    if has_rucc:
+        print("✓ RUCC / urban_rural: USDA 2023 codes (RUCC 1-3 = metro = urban)")
+    else:
+        print(f"✓ urban_rural: Classified based on population (≥{URBAN_POPULATION_THRESHOLD:,} = urban)")
+        print("\nNote: Simple population-based classification used.")
+        print("Place the USDA RUCC workbook at data/ruralurbancodes2023.xlsx for accurate codes.")
 
 if __name__ == '__main__':
     integrate_all_confounders()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Pre-aggregated OLAP cube over the county panel
+Dimensions: state x year x urban/rural x political lean x metric
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Sequence, Union
+
+from geography import urban_rural_by_population
+
+PANEL_PATH = 'dashboard_data/full_panel_data.csv'
+CUBE_PATH = 'dashboard_data/panel_cube.npz'
+
+DEFAULT_METRICS = [
+    'DrugDeaths', 'DrugDeathRate', 'SuicideDeaths', 'SuicideRate',
+    'UnemploymentRate', 'PovertyRate', 'MedianIncome', 'RepublicanMargin',
+]
+
+DIMENSIONS = ['state', 'year', 'urban_rural', 'lean']
+
+# RepublicanMargin (percentage points) cut points for the political-lean bucket
+LEAN_BINS = [-np.inf, -10.0, 10.0, np.inf]
+LEAN_LABELS = ['Democratic', 'Competitive', 'Republican']
+
+MISSING_LABEL = 'NA'
+
+
+def _urban_rural_labels(df: pd.DataFrame) -> pd.Series:
+    """Urban/rural label per row: RUCC code if present, else urban_rural, else population rule"""
+    if 'RUCC' in df.columns:
+        rucc = pd.to_numeric(df['RUCC'], errors='coerce')
+        labels = rucc.astype('Int64').astype(str)
+        return labels.where(rucc.notna(), MISSING_LABEL)
+
+    if 'urban_rural' in df.columns:
+        return df['urban_rural'].fillna(MISSING_LABEL).astype(str)
+
+    pop = pd.to_numeric(df['Population'], errors='coerce')
+    labels = pd.Series(urban_rural_by_population(pop), index=df.index)
+    return labels.fillna(MISSING_LABEL)
+
+
+def _lean_labels(df: pd.DataFrame) -> pd.Series:
+    """Political-lean bucket per row from RepublicanMargin"""
+    margin = pd.to_numeric(df['RepublicanMargin'], errors='coerce')
+    buckets = pd.cut(margin, bins=LEAN_BINS, labels=LEAN_LABELS)
+    return buckets.astype(object).where(margin.notna(), MISSING_LABEL).astype(str)
+
+
+class PanelCube:
+    """
+    Dense cube of sufficient statistics for every
+    (state, year, urban_rural, lean, metric) cell.
+
+    Stored per cell:
+      count    - number of non-null observations
+      sum      - sum of values
+      sumsq    - sum of squared values
+      pop      - summed Population over observations with a known Population
+      psum     - sum of values over those same observations
+      pop_sum  - sum of value * Population
+
+    Means, variances, population-weighted means and pooled rates are
+    derived from these arrays, so any roll-up is a reduction over axes.
+    """
+
+    STATS = ['count', 'sum', 'sumsq', 'pop', 'psum', 'pop_sum']
+
+    def __init__(self, labels: Dict[str, List], metrics: List[str], arrays: Dict[str, np.ndarray]):
+        self.labels = {dim: list(labels[dim]) for dim in DIMENSIONS}
+        self.metrics = list(metrics)
+        self.arrays = arrays
+        self._index = {
+            dim: {str(v): i for i, v in enumerate(self.labels[dim])}
+            for dim in DIMENSIONS
+        }
+
+    @property
+    def shape(self):
+        return self.arrays['count'].shape
+
+    # ------------------------------------------------------------------
+    # Construction / persistence
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_panel(cls, df: pd.DataFrame, metrics: Optional[List[str]] = None) -> 'PanelCube':
+        """Build the cube from a county-year panel in a single vectorized pass"""
+        metrics = [m for m in (metrics or DEFAULT_METRICS) if m in df.columns]
+
+        if 'state_fips' in df.columns:
+            state = df['state_fips'].astype(int).astype(str).str.zfill(2)
+        else:
+            state = df['fips'].astype(str).str.zfill(5).str[:2]
+
+        dims = {
+            'state': state,
+            'year': df['Year'].astype(int),
+            'urban_rural': _urban_rural_labels(df),
+            'lean': _lean_labels(df),
+        }
+
+        codes = []
+        labels = {}
+        for dim in DIMENSIONS:
+            c, uniques = pd.factorize(dims[dim], sort=True)
+            codes.append(c)
+            labels[dim] = [u.item() if hasattr(u, 'item') else u for u in uniques]
+
+        values = df[metrics].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        pop = pd.to_numeric(df['Population'], errors='coerce').to_numpy(dtype=np.float64)
+
+        valid = ~np.isnan(values)
+        pop_valid = valid & ~np.isnan(pop)[:, None]
+        x = np.where(valid, values, 0.0)
+        px = np.where(pop_valid, x, 0.0)
+        w = np.where(pop_valid, pop[:, None], 0.0)
+
+        shape = tuple(len(labels[dim]) for dim in DIMENSIONS) + (len(metrics),)
+        flat_cell = np.ravel_multi_index(codes, shape[:-1])
+        n_cells = int(np.prod(shape[:-1]))
+
+        arrays = {}
+        for name, contrib in [
+            ('count', valid.astype(np.float64)),
+            ('sum', x),
+            ('sumsq', x * x),
+            ('pop', w),
+            ('psum', px),
+            ('pop_sum', px * w),
+        ]:
+            out = np.zeros((n_cells, len(metrics)), dtype=np.float64)
+            np.add.at(out, flat_cell, contrib)
+            arrays[name] = out.reshape(shape)
+
+        return cls(labels, metrics, arrays)
+
+    def save(self, path: str = CUBE_PATH):
+        """Write arrays and labels to a compressed .npz"""
+        meta = json.dumps({'labels': self.labels, 'metrics': self.metrics})
+        np.savez_compressed(path, meta=np.array(meta), **self.arrays)
+
+    @classmethod
+    def load(cls, path: str = CUBE_PATH) -> 'PanelCube':
+        with np.load(path) as npz:
+            meta = json.loads(str(npz['meta']))
+            arrays = {name: npz[name] for name in cls.STATS}
+        return cls(meta['labels'], meta['metrics'], arrays)
+
+    # ------------------------------------------------------------------
+    # Query API
+    # ------------------------------------------------------------------
+
+    def _positions(self, dim: str, selector) -> List[int]:
+        if not isinstance(selector, (list, tuple, set)):
+            selector = [selector]
+        try:
+            return [self._index[dim][str(v)] for v in selector]
+        except KeyError as e:
+            raise KeyError(f"Unknown {dim} value: {e.args[0]}") from None
+
+    def slice(self, **selectors) -> 'PanelCube':
+        """
+        Dice the cube, e.g. cube.slice(state='47', urban_rural='rural').
+
+        Each selector is a single label or a list of labels for one dimension.
+        """
+        index = []
+        labels = {}
+        for dim in DIMENSIONS:
+            if dim in selectors:
+                pos = self._positions(dim, selectors.pop(dim))
+                index.append(pos)
+                labels[dim] = [self.labels[dim][i] for i in pos]
+            else:
+                index.append(list(range(len(self.labels[dim]))))
+                labels[dim] = self.labels[dim]
+        if selectors:
+            raise ValueError(f"Unknown dimensions: {sorted(selectors)}")
+
+        grid = np.ix_(*index, range(len(self.metrics)))
+        arrays = {name: arr[grid] for name, arr in self.arrays.items()}
+        return PanelCube(labels, self.metrics, arrays)
+
+    def rollup(self, by: Sequence[str] = ()) -> Dict[str, np.ndarray]:
+        """
+        Sum the sufficient statistics over every dimension not in `by`.
+
+        Returned arrays keep the order of DIMENSIONS for the retained axes,
+        with the metric axis last.
+        """
+        unknown = set(by) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown dimensions: {sorted(unknown)}")
+        axes = tuple(i for i, dim in enumerate(DIMENSIONS) if dim not in by)
+        return {name: arr.sum(axis=axes) for name, arr in self.arrays.items()}
+
+    def summarize(self, by: Union[str, Sequence[str]] = (), per: float = 100000.0) -> pd.DataFrame:
+        """
+        Long-format table of derived statistics for each group in `by`.
+
+        Columns: <by dims>, metric, count, mean, var, std, weighted_mean, rate
+        where `rate` is pooled value / pooled population * per (meaningful for
+        count metrics such as DrugDeaths).
+        """
+        if isinstance(by, str):
+            by = [by]
+        kept = [dim for dim in DIMENSIONS if dim in by]
+        agg = self.rollup(kept)
+
+        n = agg['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = agg['sum'] / n
+            var = (agg['sumsq'] - n * mean ** 2) / (n - 1)
+            var = np.where(n > 1, np.maximum(var, 0.0), np.nan)
+            weighted_mean = agg['pop_sum'] / agg['pop']
+            rate = agg['psum'] / agg['pop'] * per
+        mean = np.where(n > 0, mean, np.nan)
+        weighted_mean = np.where(agg['pop'] > 0, weighted_mean, np.nan)
+        rate = np.where(agg['pop'] > 0, rate, np.nan)
+
+        grid = pd.MultiIndex.from_product(
+            [self.labels[dim] for dim in kept] + [self.metrics],
+            names=kept + ['metric'],
+        )
+        out = pd.DataFrame({
+            'count': n.ravel().astype(np.int64),
+            'mean': mean.ravel(),
+            'var': var.ravel(),
+            'std': np.sqrt(var).ravel(),
+            'weighted_mean': weighted_mean.ravel(),
+            'rate': rate.ravel(),
+        }, index=grid)
+        return out.reset_index()
+
+
+def build_cube(panel_path: str = PANEL_PATH, cube_path: str = CUBE_PATH) -> PanelCube:
+    """Build the cube from the panel CSV and save it"""
+    print("Building OLAP cube...")
+    df = pd.read_csv(panel_path)
+    print(f"  Loaded {len(df)} county-year rows")
+
+    cube = PanelCube.from_panel(df)
+    print(f"  Cube shape (state, year, urban_rural, lean, metric): {cube.shape}")
+    print(f"  Metrics: {', '.join(cube.metrics)}")
+
+    cube.save(cube_path)
+    print(f"✓ Saved: {cube_path}")
+    return cube
+
+
+if __name__ == '__main__':
+    cube = build_cube()
+
+    print("\nDrug deaths by year (pooled rate per 100k):")
+    table = cube.summarize('year')
+    print(table[table['metric'] == 'DrugDeaths'][['year', 'count', 'mean', 'rate']].to_string(index=False))
+
+    print("\nDrug death rate by year x political lean:")
+    table = cube.summarize(['year', 'lean'])
+    print(table[table['metric'] == 'DrugDeathRate'][['year', 'lean', 'count', 'mean', 'std']].to_string(index=False))
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Partitioned, multi-process build for county and sub-county geographies
+Stages the panel by state, then completes, writes and summarizes each
+state partition in a process pool
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from geography import (
+    GEOGRAPHIES, PARTITIONS_DIR, geography_spec, normalize_ids, partition_dir, partition_path
+)
+from statistical_controls import (
+    SufficientStatsCache, combine_stats, stats_from_arrays
+)
+
+YEARS = [2018, 2019, 2020, 2021, 2022, 2023]
+
+# Fields written to each partition record (after the id and Year)
+OUTPUT_FIELDS = [
+    'DrugDeaths', 'DrugDeathRate', 'SuicideDeaths', 'SuicideRate',
+    'RepublicanMargin', 'UnemploymentRate', 'PovertyRate', 'MedianIncome',
+    'Population', 'urban_rural',
+]
+
+# Outcomes and confounders used by statistical_controls.adjust_for_confounders,
+# in the order it builds its confounder list
+ADJUSTMENT_OUTCOMES = ['DrugDeathRate', 'SuicideRate', 'UnemploymentRate']
+ADJUSTMENT_CONFOUNDERS = ['PovertyRate', 'MedianIncome', 'urban_rural']
+
+# Rows read from the input panel at a time while staging
+CHUNK_ROWS = 200000
+
+
+def _state_column(df: pd.DataFrame, geography: str) -> pd.Series:
+    """Two-digit state FIPS for each row"""
+    spec = geography_spec(geography)
+    if 'state_fips' in df.columns:
+        return normalize_ids(df['state_fips'], 2)
+    if not spec['state_in_id']:
+        raise ValueError(f"{geography} input needs a state_fips column")
+    return df[spec['id_col']].str[:2]
+
+
+def load_universe(path: str, geography: str) -> pd.DataFrame:
+    """
+    All units that should appear in the output, as [id_col, state].
+
+    Accepts a shapefile (GEOID column, e.g. the TIGER county or tract files)
+    or a CSV with the geography's id column.
+    """
+    spec = geography_spec(geography)
+    id_col = spec['id_col']
+    if path.endswith('.shp'):
+        import geopandas as gpd
+        gdf = gpd.read_file(path, ignore_geometry=True)
+        df = pd.DataFrame({id_col: gdf['GEOID']})
+        if 'STATEFP' in gdf.columns:
+            df['state_fips'] = gdf['STATEFP']
+    else:
+        df = pd.read_csv(path, dtype=str)
+
+    df[id_col] = normalize_ids(df[id_col], spec['id_width'])
+    df['state'] = _state_column(df, geography)
+    return df[[id_col, 'state']].drop_duplicates(id_col)
+
+
+def stage_by_state(
+    panel_path: str,
+    geography: str,
+    staging_dir: str,
+    chunksize: int = CHUNK_ROWS
+) -> List[str]:
+    """
+    Stream the panel CSV and append each chunk's rows to one staging CSV per
+    state, so no process ever holds more than a chunk or a single state.
+    """
+    spec = geography_spec(geography)
+    id_col = spec['id_col']
+    os.makedirs(staging_dir, exist_ok=True)
+    states = set()
+
+    for chunk in pd.read_csv(panel_path, chunksize=chunksize, dtype={id_col: str}):
+        chunk[id_col] = normalize_ids(chunk[id_col], spec['id_width'])
+        chunk['state'] = _state_column(chunk, geography)
+        for state, part in chunk.groupby('state', sort=False):
+            out = os.path.join(staging_dir, f'{state}.csv')
+            part.to_csv(out, mode='a', header=state not in states, index=False)
+            states.add(state)
+
+    return sorted(states)
+
+
+def _design(frame: pd.DataFrame, outcome: str, confounder_fields: List[str]):
+    """Vectorized equivalent of statistical_controls.encode_regression_row"""
+    mask = frame[outcome].notna()
+    for conf in confounder_fields:
+        mask &= frame[conf].notna()
+    rows = frame[mask]
+
+    columns = [np.ones(len(rows))]
+    for conf in confounder_fields:
+        if conf == 'urban_rural':
+            columns.append((rows[conf] == 'urban').to_numpy(dtype=float))
+        else:
+            columns.append(rows[conf].to_numpy(dtype=float))
+    return np.column_stack(columns), rows[outcome].to_numpy(dtype=float)
+
+
+def build_state(task: Dict) -> Dict:
+    """
+    Worker: complete one state's panel against its universe, write one
+    partition per year and return regression sufficient statistics.
+    """
+    geography = task['geography']
+    id_col = geography_spec(geography)['id_col']
+    years = task['years']
+
+    if os.path.exists(task['staging_file']):
+        df = pd.read_csv(task['staging_file'], dtype={id_col: str, 'urban_rural': str})
+    else:
+        # State present in the universe but absent from the panel
+        df = pd.DataFrame(columns=[id_col, 'Year'])
+    df['Year'] = df['Year'].astype(int)
+    df = df.drop_duplicates([id_col, 'Year'], keep='first')
+
+    ids = task['universe_ids'] if task['universe_ids'] is not None else df[id_col].unique()
+    index = pd.MultiIndex.from_product([sorted(ids), years], names=[id_col, 'Year'])
+    complete = (
+        df.set_index([id_col, 'Year'])
+        .reindex(index)
+        .reset_index()
+        .reindex(columns=[id_col, 'Year'] + OUTPUT_FIELDS)
+    )
+    numeric = [f for f in OUTPUT_FIELDS if f != 'urban_rural']
+    complete[numeric] = complete[numeric].apply(pd.to_numeric, errors='coerce')
+
+    blocks = {}
+    for year, year_df in complete.groupby('Year', sort=True):
+        out = partition_path(geography, year, task['state'], task['output_root'])
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        year_df.to_json(out, orient='records')
+
+        # Same row filter as statistical_controls.regression_counties
+        eligible = year_df[year_df['DrugDeathRate'].notna()]
+        for outcome in ADJUSTMENT_OUTCOMES:
+            for r in range(1, len(ADJUSTMENT_CONFOUNDERS) + 1):
+                for confs in combinations(ADJUSTMENT_CONFOUNDERS, r):
+                    X, Y = _design(eligible, outcome, list(confs))
+                    blocks[(int(year), outcome, confs)] = stats_from_arrays(X, Y)
+
+    return {'state': task['state'], 'rows': len(complete), 'blocks': blocks}
+
+
+def _swap_in_partitions(geography: str, years: List[int], build_root: str, output_root: str):
+    """
+    Replace each built year's partition directory with the freshly built one,
+    so states from earlier runs that this build did not produce are removed.
+    """
+    for year in years:
+        target = partition_dir(geography, year, output_root)
+        built = partition_dir(geography, year, build_root)
+        old = None
+        if os.path.isdir(target):
+            old = tempfile.mkdtemp(dir=os.path.dirname(target), prefix=f'.old_{year}_')
+            os.replace(target, os.path.join(old, str(year)))
+        if os.path.isdir(built):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(built, target)
+        if old:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def run_partitioned_build(
+    panel_path: str,
+    geography: str = 'county',
+    universe_path: Optional[str] = None,
+    years: Optional[List[int]] = None,
+    workers: Optional[int] = None,
+    output_root: str = PARTITIONS_DIR,
+    chunksize: int = CHUNK_ROWS,
+    update_stats_cache: bool = True,
+    verbose: bool = True
+) -> Dict:
+    """
+    Build one JSON partition per state and year for a geography level.
+
+    Partitions are written to a temporary tree under output_root and each
+    year's directory is swapped into place once every state has finished,
+    replacing (not merging with) the output of earlier runs.
+
+    Sufficient statistics from every state are summed per year and written
+    to the geography's regression cache, so adjustments start warm.
+    """
+    log = print if verbose else (lambda *a, **k: None)
+    years = years or YEARS
+    workers = workers or os.cpu_count() or 1
+    id_col = geography_spec(geography)['id_col']
+    timings = {}
+
+    staging_dir = tempfile.mkdtemp(prefix=f'stage_{geography}_')
+    os.makedirs(output_root, exist_ok=True)
+    build_root = tempfile.mkdtemp(dir=output_root, prefix=f'.build_{geography}_')
+    try:
+        log(f"1. Staging {panel_path} by state ({geography})...")
+        start = time.perf_counter()
+        states = stage_by_state(panel_path, geography, staging_dir, chunksize)
+        timings['stage'] = time.perf_counter() - start
+        log(f"   ✓ {len(states)} states staged in {timings['stage']:.1f}s")
+
+        universe = None
+        if universe_path:
+            universe = load_universe(universe_path, geography)
+            universe_states = set(universe['state'])
+            dropped = sorted(set(states) - universe_states)
+            if dropped:
+                # e.g. the panel's fips=0 national rows (state '00')
+                log(f"   ! Dropping {len(dropped)} staged state(s) with no units in the universe: {dropped}")
+            states = sorted(universe_states)
+            log(f"   ✓ Universe: {len(universe)} units")
+
+        tasks = []
+        for state in states:
+            ids = None
+            if universe is not None:
+                ids = universe.loc[universe['state'] == state, id_col].tolist()
+            tasks.append({
+                'state': state,
+                'staging_file': os.path.join(staging_dir, f'{state}.csv'),
+                'geography': geography,
+                'years': years,
+                'universe_ids': ids,
+                'output_root': build_root,
+            })
+
+        log(f"\n2. Building {len(tasks)} state partitions with {workers} worker(s)...")
+        start = time.perf_counter()
+        if workers == 1:
+            results = [build_state(t) for t in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(build_state, tasks))
+        timings['build'] = time.perf_counter() - start
+        total_rows = sum(r['rows'] for r in results)
+        log(f"   ✓ {total_rows} rows written in {timings['build']:.1f}s")
+
+        _swap_in_partitions(geography, years, build_root, output_root)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        shutil.rmtree(build_root, ignore_errors=True)
+
+    # Union of keys: a state can legitimately produce no blocks
+    keys = sorted({key for r in results for key in r['blocks']})
+    combined = {}
+    for key in keys:
+        combined[key] = combine_stats([r['blocks'][key] for r in results if key in r['blocks']])
+
+    if update_stats_cache and output_root == PARTITIONS_DIR:
+        # Partition-derived blocks go to their own cache, stamped with the
+        # partition files' mtimes (never the county years/*.json cache)
+        cache = SufficientStatsCache.load(geography=geography, partitioned=True)
+        for (year, outcome, confs), block in combined.items():
+            cache.store(year, outcome, list(confs), block)
+        cache.save()
+        log(f"   ✓ Regression cache updated: {cache.path}")
+
+    return {
+        'geography': geography,
+        'states': len(results),
+        'rows': sum(r['rows'] for r in results),
+        'workers': workers,
+        'timings': timings,
+        'stats': combined,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('panel', help='Panel CSV with an id column for the geography and Year')
+    parser.add_argument('--geography', default='county', choices=sorted(GEOGRAPHIES))
+    parser.add_argument('--universe', help='Shapefile or CSV listing every unit to include')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    summary = run_partitioned_build(
+        args.panel,
+        geography=args.geography,
+        universe_path=args.universe,
+        workers=args.workers,
+        chunksize=args.chunksize,
+    )
+    print(f"\n✓ Complete! {summary['rows']} {args.geography}-years across {summary['states']} states")
@@ -5,17 +5,355 @@ Implements regression-based adjustment for confounding variables
 """
 
 import json
+import os
+import tempfile
 import numpy as np
 from scipy import stats
 from typing import Dict, List, Optional, Tuple
 
-def load_year_data(year: int = 2023) -> List[Dict]:
-    """Load county data for a specific year"""
-    import os
+from geography import geography_spec, partition_path, partition_states, partitions_mtime
+
+def load_year_data(
+    year: int = 2023,
+    geography: str = 'county',
+    states: Optional[List[str]] = None,
+    partitioned: bool = False
+) -> List[Dict]:
+    """
+    Load data for a specific year.
+
+    County data comes from public/data/years/{year}.json unless `partitioned`
+    or a state filter is given; otherwise (and always for sub-county levels)
+    the per-state partitions written by partitioned_build are read,
+    restricted to `states` when given.
+    """
+    geography_spec(geography)
+    if geography == 'county' and states is None and not partitioned:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+        file_path = os.path.join(base_path, 'public', 'data', 'years', f'{year}.json')
+        with open(file_path, 'r') as f:
+            return json.load(f)
+
+    available = partition_states(geography, year)
+    if not available:
+        raise FileNotFoundError(f"No {geography} partitions for {year}")
+    data = []
+    for state in (available if states is None else [s for s in states if s in available]):
+        with open(partition_path(geography, year, state), 'r') as f:
+            data.extend(json.load(f))
+    return data
+
+def find_units(year: int, geography: str, ids: List[str]) -> Dict[str, Dict]:
+    """
+    Records for a few units without loading a whole sub-county year.
+
+    Only the units' own state partitions are read when the id encodes the
+    state; otherwise partitions are scanned one at a time until all are found.
+    """
+    spec = geography_spec(geography)
+    id_col = spec['id_col']
+    wanted = {str(i) for i in ids}
+    available = partition_states(geography, year)
+    if spec['state_in_id']:
+        states = [s for s in sorted({i[:2] for i in wanted}) if s in available]
+    else:
+        states = available
+
+    found = {}
+    for state in states:
+        with open(partition_path(geography, year, state), 'r') as f:
+            for rec in json.load(f):
+                if str(rec[id_col]) in wanted and str(rec[id_col]) not in found:
+                    found[str(rec[id_col])] = rec
+        if len(found) == len(wanted):
+            break
+    return found
+
+STATS_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'dashboard_data', 'regression_stats.json'
+)
+
+def stats_cache_path(geography: str = 'county', partitioned: bool = False) -> str:
+    """
+    Cache file for a geography level. County statistics from the year files keep
+    the original file name; county partitions get their own file so blocks from
+    the two sources never overwrite each other.
+    """
+    if geography == 'county' and not partitioned:
+        return STATS_CACHE_PATH
+    suffix = 'county_partitions' if geography == 'county' else geography
+    return STATS_CACHE_PATH.replace('.json', f'_{suffix}.json')
+
+def _year_file_mtime(year: int, geography: str = 'county', partitioned: bool = False) -> Optional[float]:
+    """Modification time of a year's data, used to detect stale cached statistics"""
+    if geography != 'county' or partitioned:
+        return partitions_mtime(geography, year)
     base_path = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(base_path, 'public', 'data', 'years', f'{year}.json')
-    with open(file_path, 'r') as f:
-        return json.load(f)
+    return os.path.getmtime(file_path) if os.path.exists(file_path) else None
+
+def regression_counties(data: List[Dict]) -> List[Dict]:
+    """Counties eligible for adjustment regressions (those with a drug death rate)"""
+    return [c for c in data if c.get('DrugDeathRate') is not None]
+
+def encode_regression_row(
+    county: Dict,
+    outcome: str,
+    confounder_fields: List[str]
+) -> Optional[Tuple[float, List[float]]]:
+    """
+    Encode one county as (y, x) for regression, or None if any value is missing.
+
+    x excludes the intercept; urban_rural is encoded urban=1, rural=0.
+    """
+    y_val = county.get(outcome)
+    if y_val is None:
+        return None
+
+    x_vals = []
+    for conf in confounder_fields:
+        conf_val = county.get(conf)
+        if conf_val is None:
+            return None
+
+        # Encode categorical variables
+        if conf == 'urban_rural':
+            # Binary encoding: urban=1, rural=0
+            x_vals.append(1 if conf_val == 'urban' else 0)
+        else:
+            # Continuous variable
+            x_vals.append(conf_val)
+
+    return y_val, x_vals
+
+def _rows_to_arrays(
+    counties: List[Dict],
+    outcome: str,
+    confounder_fields: List[str]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Design matrix (with intercept) and outcome vector for the given counties"""
+    rows = [r for r in (encode_regression_row(c, outcome, confounder_fields) for c in counties) if r]
+    k = len(confounder_fields) + 1
+    if not rows:
+        return np.empty((0, k)), np.empty(0)
+    Y = np.array([r[0] for r in rows], dtype=float)
+    X = np.column_stack([np.ones(len(rows)), np.array([r[1] for r in rows], dtype=float)])
+    return X, Y
+
+def sufficient_stats(
+    counties: List[Dict],
+    outcome: str,
+    confounder_fields: List[str]
+) -> Dict:
+    """
+    Sufficient statistics for OLS of outcome on confounders (plus intercept).
+
+    Returns X'X, X'y, y'y, n and the column / outcome means. Blocks computed
+    on disjoint sets of counties can be summed with combine_stats.
+    """
+    X, Y = _rows_to_arrays(counties, outcome, confounder_fields)
+    return stats_from_arrays(X, Y)
+
+def stats_from_arrays(X: np.ndarray, Y: np.ndarray) -> Dict:
+    n = len(Y)
+    xtx = X.T @ X
+    xty = X.T @ Y
+    return {
+        'n': n,
+        'xtx': xtx,
+        'xty': xty,
+        'yty': float(Y @ Y),
+        'x_mean': xtx[0] / n if n else np.zeros(X.shape[1]),
+        'y_mean': xty[0] / n if n else 0.0,
+    }
+
+def combine_stats(blocks: List[Dict], signs: Optional[List[int]] = None) -> Dict:
+    """Sum (or, with sign -1, subtract) sufficient-statistic blocks"""
+    if signs is None:
+        signs = [1] * len(blocks)
+    xtx = sum(s * np.asarray(b['xtx']) for s, b in zip(signs, blocks))
+    xty = sum(s * np.asarray(b['xty']) for s, b in zip(signs, blocks))
+    yty = sum(s * b['yty'] for s, b in zip(signs, blocks))
+    n = int(sum(s * b['n'] for s, b in zip(signs, blocks)))
+    return {
+        'n': n,
+        'xtx': xtx,
+        'xty': xty,
+        'yty': float(yty),
+        'x_mean': xtx[0] / n if n else np.zeros(len(xty)),
+        'y_mean': xty[0] / n if n else 0.0,
+    }
+
+def fit_from_stats(block: Dict) -> Dict:
+    """
+    OLS fit from sufficient statistics.
+
+    lstsq on the normal equations returns the same minimum-norm solution as
+    lstsq on the full design matrix, including rank-deficient cases.
+    """
+    xtx = np.asarray(block['xtx'])
+    xty = np.asarray(block['xty'])
+    beta = np.linalg.lstsq(xtx, xty, rcond=None)[0]
+    rss = block['yty'] - 2 * beta @ xty + beta @ xtx @ beta
+    return {
+        'beta': beta,
+        'n': block['n'],
+        'mean_pred': float(np.dot(block['x_mean'], beta)),
+        'rss': float(max(rss, 0.0)),
+    }
+
+class SufficientStatsCache:
+    """
+    Per-year regression sufficient statistics keyed by (year, outcome, confounders).
+
+    Blocks are persisted to dashboard_data/regression_stats.json (one file
+    per geography level, see stats_cache_path) so that
+    single-year adjustments, pooled multi-year fits, new years and county
+    corrections reuse them instead of rebuilding regressions from raw rows.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        geography: str = 'county',
+        partitioned: bool = False
+    ):
+        """
+        `path` defaults to stats_cache_path(geography, partitioned) so each data
+        source keeps its own file; pass '' for an in-memory cache.
+        """
+        self.geography = geography
+        # Sub-county levels only exist as partitions
+        self.partitioned = partitioned or geography != 'county'
+        self.path = stats_cache_path(geography, self.partitioned) if path is None else path
+        self.blocks: Dict[str, Dict] = {}
+        self.dirty = False
+
+    @staticmethod
+    def key(year: int, outcome: str, confounder_fields: List[str]) -> str:
+        return f"{year}|{outcome}|{','.join(confounder_fields)}"
+
+    @classmethod
+    def load(
+        cls,
+        path: Optional[str] = None,
+        geography: str = 'county',
+        partitioned: bool = False
+    ) -> 'SufficientStatsCache':
+        cache = cls(path, geography, partitioned)
+        path = cache.path
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    raw = json.load(f)
+            except (OSError, ValueError):
+                raw = {}
+            for key, b in raw.get('blocks', {}).items():
+                cache.blocks[key] = {
+                    **b,
+                    'xtx': np.array(b['xtx'], dtype=float),
+                    'xty': np.array(b['xty'], dtype=float),
+                    'x_mean': np.array(b['x_mean'], dtype=float),
+                }
+        return cache
+
+    def save(self):
+        """
+        Persist blocks if any changed, writing a temp file and renaming it into
+        place so concurrent processes never see a partially written cache.
+        """
+        if not self.path or not self.dirty:
+            return
+        serializable = {
+            key: {
+                **b,
+                'xtx': np.asarray(b['xtx']).tolist(),
+                'xty': np.asarray(b['xty']).tolist(),
+                'x_mean': np.asarray(b['x_mean']).tolist(),
+                'y_mean': float(b['y_mean']),
+            }
+            for key, b in self.blocks.items()
+        }
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path) or '.', prefix='.regression_stats_', suffix='.tmp'
+            )
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'blocks': serializable}, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError:
+            # Read-only deployments still work, just without persistence
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def store(self, year: int, outcome: str, confounder_fields: List[str], block: Dict):
+        """Record a block as current for the year's data as it is on disk now"""
+        block['source_mtime'] = _year_file_mtime(year, self.geography, self.partitioned)
+        self.blocks[self.key(year, outcome, confounder_fields)] = block
+        self.dirty = True
+
+    def get(
+        self,
+        year: int,
+        outcome: str,
+        confounder_fields: List[str],
+        counties: Optional[List[Dict]] = None
+    ) -> Dict:
+        """
+        Cached block for one year, computed on a miss or when the year file
+        has changed since the block was built. Call save() to persist.
+        """
+        key = self.key(year, outcome, confounder_fields)
+        block = self.blocks.get(key)
+        if block is not None and block.get('source_mtime') == _year_file_mtime(
+            year, self.geography, self.partitioned
+        ):
+            return block
+
+        if counties is None:
+            counties = regression_counties(load_year_data(year, self.geography, partitioned=self.partitioned))
+        block = sufficient_stats(counties, outcome, confounder_fields)
+        self.store(year, outcome, confounder_fields, block)
+        return block
+
+    def add_year(self, year: int):
+        """Build blocks for a newly added year for every cached outcome/confounder set"""
+        counties = regression_counties(load_year_data(year, self.geography, partitioned=self.partitioned))
+        specs = {tuple(key.split('|')[1:]) for key in self.blocks}
+        for outcome, confs in specs:
+            confounder_fields = confs.split(',') if confs else []
+            block = sufficient_stats(counties, outcome, confounder_fields)
+            self.store(year, outcome, confounder_fields, block)
+        self.save()
+
+    def apply_corrections(self, year: int, old_records: List[Dict], new_records: List[Dict]):
+        """
+        Rank-k update of every cached block for `year` after county corrections.
+
+        old_records are the rows as they were when the block was built and
+        new_records their replacements; call after the year file is rewritten.
+        """
+        old_rows = regression_counties(old_records)
+        new_rows = regression_counties(new_records)
+        prefix = f"{year}|"
+        for key in [k for k in self.blocks if k.startswith(prefix)]:
+            _, outcome, confs = key.split('|')
+            confounder_fields = confs.split(',') if confs else []
+            X_old, Y_old = _rows_to_arrays(old_rows, outcome, confounder_fields)
+            X_new, Y_new = _rows_to_arrays(new_rows, outcome, confounder_fields)
+            block = combine_stats(
+                [self.blocks[key], stats_from_arrays(X_new, Y_new), stats_from_arrays(X_old, Y_old)],
+                signs=[1, 1, -1],
+            )
+            self.store(year, outcome, confounder_fields, block)
+        self.save()
+
+    def fit_pooled(self, years: List[int], outcome: str, confounder_fields: List[str]) -> Dict:
+        """Pooled OLS over several years assembled from the cached per-year blocks"""
+        blocks = [self.get(year, outcome, confounder_fields) for year in years]
+        return fit_from_stats(combine_stats(blocks))
 
 def adjust_for_confounders(
     county_a_fips: str,
@@ -23,30 +361,43 @@ def adjust_for_confounders(
     year: int,
     control_poverty: bool = False,
     control_income: bool = False,
-    control_urban_rural: bool = False
+    control_urban_rural: bool = False,
+    stats_cache: Optional['SufficientStatsCache'] = None,
+    geography: str = 'county'
 ) -> Dict:
     """
     Adjust comparison metrics for confounding variables using residualization.
 
-    Returns both raw and adjusted values for comparison.
+    Returns both raw and adjusted values for comparison. `geography` selects
+    the unit level (county, tract, zcta); the two ids are matched against
+    that level's identifier field. Sub-county levels only read the partitions
+    holding the two units; regression statistics come from the cache.
     """
-    data = load_year_data(year)
+    id_col = geography_spec(geography)['id_col']
+    if stats_cache is None:
+        stats_cache = SufficientStatsCache.load(geography=geography)
 
-    # Convert to arrays for regression
-    counties = []
-    for c in data:
-        if c.get('DrugDeathRate') is not None:
-            counties.append(c)
+    if geography == 'county':
+        data = load_year_data(year)
 
-    if len(counties) < 50:
-        return {
-            'error': 'Insufficient data for statistical adjustment',
-            'counties_available': len(counties)
-        }
+        # Counties eligible for regression
+        counties = regression_counties(data)
+
+        if len(counties) < 50:
+            return {
+                'error': 'Insufficient data for statistical adjustment',
+                'counties_available': len(counties)
+            }
 
-    # Find target counties
-    county_a = next((c for c in data if str(c['fips']) == str(county_a_fips)), None)
-    county_b = next((c for c in data if str(c['fips']) == str(county_b_fips)), None)
+        # Find target counties
+        county_a = next((c for c in data if str(c[id_col]) == str(county_a_fips)), None)
+        county_b = next((c for c in data if str(c[id_col]) == str(county_b_fips)), None)
+    else:
+        # Blocks missing from the cache are built from all partitions by get()
+        counties = None
+        units = find_units(year, geography, [county_a_fips, county_b_fips])
+        county_a = units.get(str(county_a_fips))
+        county_b = units.get(str(county_b_fips))
 
     if not county_a or not county_b:
         return {'error': 'County not found'}
@@ -90,55 +441,25 @@ def adjust_for_confounders(
             }
             continue
 
-        # Build regression dataset
-        Y = []
-        X = []
-        for c in counties:
-            y_val = c.get(outcome)
-            if y_val is None:
-                continue
-
-            x_vals = []
-            skip = False
-            for conf in confounder_fields:
-                conf_val = c.get(conf)
-                if conf_val is None:
-                    skip = True
-                    break
+        # Regression sufficient statistics (cached per year/outcome/confounder set)
+        block = stats_cache.get(year, outcome, confounder_fields, counties)
+        n_obs = int(block['n'])
 
-                # Encode categorical variables
-                if conf == 'urban_rural':
-                    # Binary encoding: urban=1, rural=0
-                    x_vals.append(1 if conf_val == 'urban' else 0)
-                else:
-                    # Continuous variable
-                    x_vals.append(conf_val)
-
-            if not skip:
-                Y.append(y_val)
-                X.append(x_vals)
-
-        if len(Y) < 30:
+        if n_obs < 30:
             results[outcome] = {
                 'raw_a': raw_a,
                 'raw_b': raw_b,
                 'adjusted_a': None,
                 'adjusted_b': None,
-                'adjustment_note': f'Insufficient data (n={len(Y)})'
+                'adjustment_note': f'Insufficient data (n={n_obs})'
             }
             continue
 
-        # Convert to numpy arrays
-        Y = np.array(Y)
-        X = np.array(X)
-
-        # Add intercept
-        X = np.column_stack([np.ones(len(X)), X])
-
         # Fit linear regression
         try:
-            # Use least squares: beta = (X'X)^-1 X'Y
-            beta = np.linalg.lstsq(X, Y, rcond=None)[0]
+            # Solve the normal equations: beta = (X'X)^-1 X'Y
+            fit = fit_from_stats(block)
+            beta = fit['beta']
 
             # Compute residuals (adjusted values)
             # For county A and B, compute predicted value based on their confounders
@@ -147,15 +468,19 @@ def adjust_for_confounders(
             # Get confounder values for counties A and B
             conf_a = []
             conf_b = []
-            for conf in confounder_fields:
+            for j, conf in enumerate(confounder_fields):
                 val_a = county_a.get(conf)
                 val_b = county_b.get(conf)
 
                 # Encode categorical variables
                 if conf == 'urban_rural':
-                    # Calculate mode (most common) for categorical
-                    conf_values = [c.get(conf) for c in counties if c.get(conf) is not None]
-                    mode_val = max(set(conf_values), key=conf_values.count) if conf_values else 'rural'
+                    if counties is not None:
+                        # Calculate mode (most common) for categorical
+                        conf_values = [c.get(conf) for c in counties if c.get(conf) is not None]
+                        mode_val = max(set(conf_values), key=conf_values.count) if conf_values else 'rural'
+                    else:
+                        # Sub-county levels: mode of the cached binary encoding
+                        mode_val = 'urban' if block['x_mean'][j + 1] > 0.5 else 'rural'
 
                     # Binary encoding: urban=1, rural=0
                     val_a_encoded = 1 if (val_a if val_a is not None else mode_val) == 'urban' else 0
@@ -164,9 +489,13 @@ def adjust_for_confounders(
                     conf_a.append(val_a_encoded)
                     conf_b.append(val_b_encoded)
                 else:
-                    # Calculate mean for continuous variables
-                    conf_values = [c.get(conf) for c in counties if c.get(conf) is not None]
-                    mean_val = np.mean(conf_values) if conf_values else 0
+                    if counties is not None:
+                        # Calculate mean for continuous variables
+                        conf_values = [c.get(conf) for c in counties if c.get(conf) is not None]
+                        mean_val = np.mean(conf_values) if conf_values else 0
+                    else:
+                        # Sub-county levels: regression sample mean cached in the block
+                        mean_val = float(block['x_mean'][j + 1])
 
                     # Use county value if available, otherwise use mean
                     conf_a.append(val_a if val_a is not None else mean_val)
@@ -181,8 +510,7 @@ def adjust_for_confounders(
             pred_b = np.dot(X_b, beta)
 
             # Mean predicted value across all counties
-            pred_all = np.dot(X, beta)
-            mean_pred = np.mean(pred_all)
+            mean_pred = fit['mean_pred']
 
             # Adjusted values: observed - (predicted - mean_predicted)
             # This removes the effect of confounders while preserving the outcome scale
@@ -200,7 +528,7 @@ def adjust_for_confounders(
                 'adjusted_b': round(adjusted_b, 2),
                 'adjustment_pct_a': round(adj_pct_a, 1),
                 'adjustment_pct_b': round(adj_pct_b, 1),
-                'n_counties': len(Y),
+                'n_counties': n_obs,
                 'confounders': confounder_fields,
                 'adjustment_note': f'Adjusted for: {", ".join(confounder_fields)}'
             }
@@ -214,6 +542,9 @@ def adjust_for_confounders(
                 'adjustment_note': 'Regression failed (multicollinearity?)'
             }
 
+    # Persist any blocks built on this call in a single write
+    stats_cache.save()
+
     return results
 
 
@@ -228,7 +559,7 @@ if __name__ == '__main__':
         fips = str(c.get('fips', 0))
         if (c.get('DrugDeathRate') is not None and
             c.get('PovertyRate') is not None and
-            c.get('fips', 0) > 1000 and
+            int(c.get('fips', 0)) > 1000 and
             fips not in seen_fips):
             test_counties.append(fips)
             seen_fips.add(fips)
@@ -258,3 +589,9 @@ if __name__ == '__main__':
 
     print("\n3. Full results with poverty control:")
     print(json.dumps(result, indent=2))
+
+    print("\n4. Pooled 2018-2023 fit from cached per-year statistics:")
+    cache = SufficientStatsCache.load()
+    pooled = cache.fit_pooled([2018, 2019, 2020, 2021, 2022, 2023], 'DrugDeathRate', ['PovertyRate'])
+    cache.save()
+    print(f"  n={pooled['n']}, beta={[round(float(b), 4) for b in pooled['beta']]}")